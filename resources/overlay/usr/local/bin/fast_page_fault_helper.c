@@ -3,8 +3,9 @@
 
 // Helper program for triggering fast page faults after UFFD snapshot restore.
 // Allocates a 128M memory area using mmap, touches every page in it using memset and then
-// calls `sigwait` to wait for a SIGUSR1 signal. Upon receiving this signal,
-// set the entire memory area to 1, to trigger fast page fault.
+// calls `sigwait` to wait for a SIGUSR1 signal (which is blocked, so that it
+// does not terminate the process). Upon receiving this signal, set the entire
+// memory area to 2, to trigger fast page fault, and exit.
 // The idea is that an integration test takes a snapshot while the process is
 // waiting for the SIGUSR1 signal, and then sends the signal after restoring.
 // This way, the `memset` will trigger a fast page fault for every page in
@@ -27,16 +28,24 @@ int main(int argc, char *const argv[]) {
         return -1;
     }
 
-    void *ptr = mmap(NULL, MEM_SIZE_MIB, PROT_READ | PROT_WRITE, MAP_ANONYMOUS | MAP_PRIVATE, -1, 0);
+    if(sigprocmask(SIG_BLOCK, &set, NULL) == -1) {
+        perror("sigprocmask");
+        return -1;
+    }
 
-    memset(ptr, 1, MEM_SIZE_MIB);
+    void *ptr = mmap(NULL, MEM_SIZE_MIB, PROT_READ | PROT_WRITE, MAP_ANONYMOUS | MAP_PRIVATE, -1, 0);
 
     if(MAP_FAILED == ptr) {
         perror("mmap");
         return -1;
     }
 
-    sigwait(&set, &signal);
+    memset(ptr, 1, MEM_SIZE_MIB);
+
+    if(sigwait(&set, &signal) != 0) {
+        fprintf(stderr, "sigwait failed\n");
+        return -1;
+    }
 
     memset(ptr, 2, MEM_SIZE_MIB);
 
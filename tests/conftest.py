@@ -65,6 +65,12 @@ def pytest_addoption(parser):
         action="store",
         help="use firecracker/jailer binaries from this directory instead of compiling from source",
     )
+    parser.addoption(
+        "--use-diff-template",
+        action="store_true",
+        help="create the template snapshots of snapshot restore benchmarks as diff snapshots, "
+        "which only write the guest memory that was dirtied",
+    )
 
 
 @pytest.hookimpl(wrapper=True, tryfirst=True)
@@ -23,12 +23,9 @@ does not block PRs). If not, it fails, preventing PRs from introducing new vulne
 """
 import contextlib
 import os
-import statistics
 from pathlib import Path
 from typing import Callable, List, Optional, TypeVar
 
-import scipy
-
 from framework import utils
 from framework.microvm import Microvm
 from framework.utils import CommandReturn
@@ -219,11 +216,19 @@ def check_regression(
 
     Useful for performance tests.
     """
+    # scipy (and numpy) are only needed for performance A/B-tests, so do not import them whenever this module
+    # is imported (e.g. by the security A/B-tests), as they take a while to load.
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    import scipy
+
     return scipy.stats.permutation_test(
         (a_samples, b_samples),
         # Compute the difference of means, such that a positive different indicates potential for regression.
-        lambda x, y: statistics.mean(y) - statistics.mean(x),
-        vectorized=False,
+        # The statistic is vectorized, so scipy can evaluate it on whole batches of resamples at once, instead of
+        # calling back into Python for every single one.
+        lambda x, y, axis: np.mean(y, axis=axis) - np.mean(x, axis=axis),
+        vectorized=True,
         n_resamples=n_resamples,
     )
 
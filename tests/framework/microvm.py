@@ -43,6 +43,17 @@ from host_tools.memory import MemoryMonitor
 
 LOG = logging.getLogger("microvm")
 
+# Log messages are either
+# 2023-06-16T07:45:41.767987318 [fc44b23e-ce47-4635-9549-5779a6bd9cee:fc_api] The API server received a Get request on "/mmds".
+# or
+# 2023-06-16T07:47:31.204704732 [2f2427c7-e4de-4226-90e6-e3556402be84:fc_api] The API server received a Put request on "/actions" with body "{\"action_type\": \"InstanceStart\"}".
+API_REQUEST_REGEX = re.compile(
+    r"\] The API server received a (?P<method>\w+) request on \"(?P<url>(/(\w|-)*)+)\"( with body (?P<body>.*))?\."
+)
+# Durations are logged as
+# 2023-06-16T07:47:31.204704732 [2f2427c7-e4de-4226-90e6-e3556402be84:fc_api] Total previous API call duration: 243 us.
+API_CALL_DURATION_MARKER = "] Total previous API call duration: "
+
 
 class SnapshotType(Enum):
     """Supported snapshot types."""
@@ -213,6 +224,7 @@ class Microvm:
         self.api = None
         self.log_file = None
         self.metrics_file = None
+        self.ssh_connections = []
         self._spawned = False
         self._killed = False
 
@@ -247,6 +259,11 @@ class Microvm:
         for monitor in self.monitors:
             monitor.stop()
 
+        # Close persistent SSH connections while the network namespace still exists
+        for connection in self.ssh_connections:
+            connection.close()
+        self.ssh_connections.clear()
+
         # We start with vhost-user backends,
         # because if we stop Firecracker first, the backend will want
         # to exit as well and this will cause a race condition.
@@ -304,17 +321,6 @@ class Microvm:
         Parses the firecracker logs for information regarding api server request processing times, and asserts they
         are within acceptable bounds.
         """
-        # Log messages are either
-        # 2023-06-16T07:45:41.767987318 [fc44b23e-ce47-4635-9549-5779a6bd9cee:fc_api] The API server received a Get request on "/mmds".
-        # or
-        # 2023-06-16T07:47:31.204704732 [2f2427c7-e4de-4226-90e6-e3556402be84:fc_api] The API server received a Put request on "/actions" with body "{\"action_type\": \"InstanceStart\"}".
-        api_request_regex = re.compile(
-            r"\] The API server received a (?P<method>\w+) request on \"(?P<url>(/(\w|-)*)+)\"( with body (?P<body>.*))?\."
-        )
-        api_request_times_regex = re.compile(
-            r"\] Total previous API call duration: (?P<execution_time>\d+) us.$"
-        )
-
         # Note: Processing of api requests is synchronous, so these messages cannot be torn by concurrency effects
         log_lines = self.log_data.split("\n")
 
@@ -323,7 +329,7 @@ class Microvm:
         current_call = None
 
         for log_line in log_lines:
-            match = api_request_regex.search(log_line)
+            match = API_REQUEST_REGEX.search(log_line)
 
             if match:
                 if current_call is not None:
@@ -335,16 +341,21 @@ class Microvm:
                     match.group("method"), match.group("url"), match.group("body")
                 )
 
-            match = api_request_times_regex.search(log_line)
+            _, marker, execution_time = log_line.partition(API_CALL_DURATION_MARKER)
 
-            if match:
+            if marker:
                 if current_call is None:
                     raise Exception(
                         "Got API call duration log entry before request entry"
                     )
 
                 if current_call.url != "/snapshot/create":
-                    exec_time = float(match.group("execution_time")) / 1000.0
+                    try:
+                        exec_time = float(execution_time.removesuffix(" us.")) / 1000.0
+                    except ValueError as err:
+                        raise Exception(
+                            f"Malformed API call duration log entry: {log_line}"
+                        ) from err
 
                     assert (
                         exec_time <= MAX_API_CALL_DURATION_MS
@@ -441,8 +452,26 @@ class Microvm:
     def flush_metrics(self):
         """Flush the microvm metrics and get the latest datapoint"""
         self.api.actions.put(action_type="FlushMetrics")
-        # get the latest metrics
-        return self.get_all_metrics()[-1]
+        # The flush is synchronous, so the latest datapoint is the last complete line of the metrics file. Read
+        # the file backwards until we have that line, instead of parsing every datapoint written so far. Like
+        # get_metrics, skip lines that are not whole JSON objects, e.g. a periodic flush that is still in progress.
+        with self.metrics_file.open("rb") as fd:
+            pos = fd.seek(0, os.SEEK_END)
+            data = b""
+            while pos > 0:
+                chunk_size = min(pos, 64 * 1024)
+                pos -= chunk_size
+                fd.seek(pos)
+                data = fd.read(chunk_size) + data
+                # Whatever follows the last newline has not been fully written yet, and unless we reached the
+                # start of the file, whatever precedes the first newline is only the tail end of a line.
+                lines = data.split(b"\n")[:-1]
+                if pos > 0:
+                    lines = lines[1:]
+                for line in reversed(lines):
+                    if line.endswith(b"}"):
+                        return json.loads(line)
+        raise AssertionError("no complete datapoint in the metrics file")
 
     def create_jailed_resource(self, path):
         """Create a hard link to some resource inside this microvm."""
@@ -474,34 +503,62 @@ class Microvm:
         """Get the screen PID."""
         return self._screen_pid
 
-    def pin_vmm(self, cpu_id: int) -> bool:
-        """Pin the firecracker process VMM thread to a cpu list."""
-        if self.firecracker_pid:
-            for thread_name, thread_pids in utils.get_threads(
-                self.firecracker_pid
-            ).items():
-                # the firecracker thread should start with firecracker...
-                if thread_name.startswith("firecracker"):
-                    for pid in thread_pids:
-                        utils.set_cpu_affinity(pid, [cpu_id])
-                return True
-        return False
-
-    def pin_vcpu(self, vcpu_id: int, cpu_id: int):
-        """Pin the firecracker vcpu thread to a cpu list."""
-        if self.firecracker_pid:
-            for thread in utils.get_threads(self.firecracker_pid)[f"fc_vcpu {vcpu_id}"]:
-                utils.set_cpu_affinity(thread, [cpu_id])
-            return True
-        return False
-
-    def pin_api(self, cpu_id: int):
-        """Pin the firecracker process API server thread to a cpu list."""
-        if self.firecracker_pid:
-            for thread in utils.get_threads(self.firecracker_pid)["fc_api"]:
-                utils.set_cpu_affinity(thread, [cpu_id])
-            return True
-        return False
+    @staticmethod
+    def _pin(thread_pids: list, cpu_id: int) -> bool:
+        """Pin the given threads to a cpu. Returns whether there were any threads to pin."""
+        for pid in thread_pids:
+            utils.set_cpu_affinity(pid, [cpu_id])
+        return bool(thread_pids)
+
+    def _threads(self, threads: Optional[dict]) -> Optional[dict]:
+        """Returns `threads` if given, otherwise looks up the threads of the firecracker process, if it is running."""
+        if threads is None and self.firecracker_pid:
+            threads = utils.get_threads(self.firecracker_pid)
+        return threads
+
+    def pin_vmm(self, cpu_id: int, threads: Optional[dict] = None) -> bool:
+        """Pin the firecracker process VMM thread to a cpu list.
+
+        `threads` is the thread mapping of this microVM, as returned by `utils.get_threads`. It is looked up if
+        not given.
+        """
+        threads = self._threads(threads)
+        if threads is None:
+            return False
+        # the firecracker thread should start with firecracker...
+        return self._pin(
+            [
+                pid
+                for thread_name, thread_pids in threads.items()
+                if thread_name.startswith("firecracker")
+                for pid in thread_pids
+            ],
+            cpu_id,
+        )
+
+    def pin_vcpu(
+        self, vcpu_id: int, cpu_id: int, threads: Optional[dict] = None
+    ) -> bool:
+        """Pin the firecracker vcpu thread to a cpu list.
+
+        `threads` is the thread mapping of this microVM, as returned by `utils.get_threads`. It is looked up if
+        not given.
+        """
+        threads = self._threads(threads)
+        if threads is None:
+            return False
+        return self._pin(threads[f"fc_vcpu {vcpu_id}"], cpu_id)
+
+    def pin_api(self, cpu_id: int, threads: Optional[dict] = None) -> bool:
+        """Pin the firecracker process API server thread to a cpu list.
+
+        `threads` is the thread mapping of this microVM, as returned by `utils.get_threads`. It is looked up if
+        not given.
+        """
+        threads = self._threads(threads)
+        if threads is None:
+            return False
+        return self._pin(threads["fc_api"], cpu_id)
 
     def pin_threads(self, first_cpu):
         """
@@ -509,18 +566,23 @@ class Microvm:
 
         Return next "free" cpu core.
         """
+        assert self.firecracker_pid, "Firecracker is not running."
+
+        # Look up the threads only once, instead of once for every thread we pin.
+        threads = utils.get_threads(self.firecracker_pid)
+
         for vcpu, pcpu in enumerate(range(first_cpu, first_cpu + self.vcpus_count)):
             assert self.pin_vcpu(
-                vcpu, pcpu
+                vcpu, pcpu, threads=threads
             ), f"Failed to pin fc_vcpu {vcpu} thread to core {pcpu}."
         # The cores first_cpu,...,first_cpu + self.vcpus_count - 1 are assigned to the individual vCPU threads,
         # So the remaining two threads (VMM and API) get first_cpu + self.vcpus_count
         # and first_cpu + self.vcpus_count + 1
         assert self.pin_vmm(
-            first_cpu + self.vcpus_count
+            first_cpu + self.vcpus_count, threads=threads
         ), "Failed to pin firecracker thread."
         assert self.pin_api(
-            first_cpu + self.vcpus_count + 1
+            first_cpu + self.vcpus_count + 1, threads=threads
         ), "Failed to pin fc_api thread."
 
         return first_cpu + self.vcpus_count + 2
@@ -894,11 +956,9 @@ class Microvm:
         jailed_mem = Path("/") / mem_src.name
         jailed_vmstate = Path("/") / vmstate_src.name
 
-        snapshot_disks = [v for k, v in snapshot.disks.items()]
-        assert len(snapshot_disks) > 0, "Snapshot requires at least one disk."
-        jailed_disks = []
-        for disk in snapshot_disks:
-            jailed_disks.append(self.create_jailed_resource(disk))
+        assert len(snapshot.disks) > 0, "Snapshot requires at least one disk."
+        for disk in snapshot.disks.values():
+            self.create_jailed_resource(disk)
         self.disks = snapshot.disks
         self.ssh_key = snapshot.ssh_key
 
@@ -931,12 +991,15 @@ class Microvm:
         """Return a cached SSH connection on a given interface id."""
         guest_ip = list(self.iface.values())[iface_idx]["iface"].guest_ip
         self.ssh_key = Path(self.ssh_key)
-        return net_tools.SSHConnection(
+        connection = net_tools.SSHConnection(
             netns=self.netns.id,
             ssh_key=self.ssh_key,
             user="root",
             host=guest_ip,
         )
+        # Keep track of connections, so their multiplexed sessions can be closed in `kill`
+        self.ssh_connections.append(connection)
+        return connection
 
     @property
     def ssh(self):
@@ -1015,9 +1078,18 @@ class MicroVMFactory:
         return vm
 
     def kill(self):
-        """Clean up all built VMs"""
+        """Clean up all built VMs
+
+        Keeps going if killing one of the VMs fails (for example, because a post-test check such as the memory
+        monitor raised), so that no VMs are leaked into later tests. The first error is re-raised at the end.
+        """
+        errors = []
         for vm in self.vms:
-            vm.kill()
+            try:
+                vm.kill()
+            # pylint: disable=broad-except
+            except Exception as err:
+                errors.append(err)
             vm.jailer.cleanup()
             chroot_base_with_id = vm.jailer.chroot_base_with_id()
             if len(vm.jailer.jailer_id) > 0 and chroot_base_with_id.exists():
@@ -1026,6 +1098,9 @@ class MicroVMFactory:
 
         self.vms.clear()
 
+        if errors:
+            raise errors[0]
+
 
 class Serial:
     """Class for serial console communication with a Microvm."""
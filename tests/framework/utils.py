@@ -469,8 +469,12 @@ def get_firecracker_version_from_toml():
     return packaging.version.parse(stdout)
 
 
+@functools.lru_cache
 def get_kernel_version(level=2):
-    """Return the current kernel version in format `major.minor.patch`."""
+    """Return the current kernel version in format `major.minor.patch`.
+
+    The host kernel cannot change while the tests are running, so the result is cached.
+    """
     linux_version = platform.release()
     actual_level = 0
     for idx, char in enumerate(linux_version):
@@ -482,6 +486,7 @@ def get_kernel_version(level=2):
     return linux_version
 
 
+@functools.lru_cache
 def is_io_uring_supported():
     """
     Return whether Firecracker supports io_uring for the running kernel ...
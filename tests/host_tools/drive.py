@@ -36,10 +36,9 @@ class FilesystemFile:
         if os.path.isfile(path):
             raise FileExistsError("File already exists: " + path)
 
-        utils.run_cmd(
-            "dd status=none if=/dev/zero"
-            "    of=" + path + "    bs=1M count=" + str(size)
-        )
+        # Reserve all the blocks upfront, instead of writing zeros through dd
+        with open(path, "wb") as file:
+            os.posix_fallocate(file.fileno(), 0, size * 2**20)
         utils.run_cmd("mkfs.ext4 -qF " + path)
         self.path = path
 
@@ -5,6 +5,7 @@
 import ipaddress
 import random
 import string
+import tempfile
 from dataclasses import dataclass, field
 from pathlib import Path
 
@@ -37,6 +38,12 @@ class SSHConnection:
         self.host = host
         self.user = user
 
+        # Multiplex all commands over a single connection to the guest, so that
+        # only the first one pays for the TCP and SSH handshakes. The control
+        # socket is unique per connection object, as guests in different
+        # network namespaces can share the same IP address.
+        self.control_path = Path(tempfile.gettempdir()) / f"fc-ssh-{random_str(k=8)}"
+
         self.options = [
             "-o",
             "LogLevel=ERROR",
@@ -48,6 +55,12 @@ class SSHConnection:
             "UserKnownHostsFile=/dev/null",
             "-o",
             "PreferredAuthentications=publickey",
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={self.control_path}",
+            "-o",
+            "ControlPersist=5s",
             "-i",
             str(self.ssh_key),
         ]
@@ -107,6 +120,20 @@ class SSHConnection:
             timeout,
         )
 
+    def close(self):
+        """Tear down the shared connection to the guest, if there is one."""
+        self._exec(
+            [
+                "ssh",
+                "-O",
+                "exit",
+                "-o",
+                f"ControlPath={self.control_path}",
+                f"{self.user}@{self.host}",
+            ]
+        )
+        self.control_path.unlink(missing_ok=True)
+
     def _exec(self, cmd, timeout=None):
         """Private function that handles the ssh client invocation."""
         if self.netns is not None:
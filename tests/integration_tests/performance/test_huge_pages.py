@@ -1,22 +1,27 @@
 # Copyright 2024 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 """Integration tests for Firecracker's huge pages support"""
-import signal
-import time
+import os
+import re
+from functools import lru_cache
+from typing import Optional
 
 import pytest
 
-from framework import utils
 from framework.microvm import HugePagesConfig
 from framework.properties import global_props
 from framework.utils_ftrace import ftrace_events
 from integration_tests.functional.test_uffd import SOCKET_PATH, spawn_pf_handler
 
 
-def check_hugetlbfs_in_use(pid: int, allocation_name: str):
+def check_hugetlbfs_in_use(pid: int, allocation_name: Optional[str] = None):
     """Asserts that the process with the given `pid` is using hugetlbfs pages somewhere.
 
-    `allocation_name` should be the name of the smaps entry for which we want to verify that huge pages are used.
+    If `allocation_name` is not given, only checks that some hugetlbfs pages are mapped into the process, which
+    only requires looking at the (small) smaps_rollup summary instead of every mapping of the process. This is a
+    weaker check: it does not verify that the guest memory mapping itself is backed by pages larger than 4K.
+    Otherwise, `allocation_name` should be the name of the smaps entry for which we want to verify that huge pages
+    are used.
     For memfd-backed guest memory, this would be "memfd:guest_mem" (the `guest_mem` part originating from the name
     we give the memfd in memory.rs), for anonymous memory this would be "/anon_hugepage".
     Note: in our testing, we do not currently configure vhost-user-blk devices, so we only exercise
@@ -48,13 +53,49 @@ def check_hugetlbfs_in_use(pid: int, allocation_name: str):
     #   Locked:                0 kB
     #   THPeligible:           0
     #   ProtectionKey:         0
-    cmd = f"cat /proc/{pid}/smaps | grep {allocation_name} -A 23 | grep KernelPageSize"
-    _, stdout, _ = utils.run_cmd(cmd)
+    if allocation_name is None:
+        assert _hugetlb_kib(pid) > 0
+        return
 
-    kernel_page_size_kib = int(stdout.split()[1])
+    kernel_page_size_kib = _kernel_page_size_kib(pid, allocation_name)
+
+    assert kernel_page_size_kib is not None, f"No smaps entry for {allocation_name}"
     assert kernel_page_size_kib > 4
 
 
+def _hugetlb_kib(pid: int):
+    """Returns the total amount (in KiB) of hugetlbfs memory mapped by process `pid`, according to smaps_rollup"""
+    fd = os.open(f"/proc/{pid}/smaps_rollup", os.O_RDONLY)
+    try:
+        rollup = os.read(fd, 8192).decode()
+    finally:
+        os.close(fd)
+
+    # smaps_rollup contains the same fields as a single smaps entry, summed over all mappings
+    return sum(
+        int(line.split()[1])
+        for line in rollup.splitlines()
+        if line.startswith(("Private_Hugetlb:", "Shared_Hugetlb:"))
+    )
+
+
+def _kernel_page_size_kib(pid: int, allocation_name: str):
+    """Returns the KernelPageSize (in KiB) of the `allocation_name` smaps entry of process `pid`"""
+    with open(f"/proc/{pid}/smaps", encoding="utf-8") as smaps:
+        match = _smaps_entry_regex(allocation_name).search(smaps.read())
+
+    return int(match.group(1)) if match else None
+
+
+@lru_cache
+def _smaps_entry_regex(allocation_name: str):
+    """Compiles a regex matching the first KernelPageSize line following the header of the `allocation_name` entry"""
+    return re.compile(
+        rf"^\S+[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]+[^\n]*{re.escape(allocation_name)}.*?^KernelPageSize:\s+(\d+)",
+        re.MULTILINE | re.DOTALL,
+    )
+
+
 @pytest.mark.skipif(
     global_props.host_linux_version == "4.14",
     reason="MFD_HUGETLB | MFD_ALLOW_SEALING only supported on kernels >= 4.16",
@@ -68,10 +109,9 @@ def test_hugetlbfs_boot(uvm_plain):
     uvm_plain.start()
     uvm_plain.wait_for_up()
 
-    check_hugetlbfs_in_use(
-        uvm_plain.firecracker_pid,
-        "/anon_hugepage",
-    )
+    check_hugetlbfs_in_use(uvm_plain.firecracker_pid, "/anon_hugepage")
+    # The guest memory mapping being hugetlbfs-backed does not mean the guest actually faulted any of it in
+    check_hugetlbfs_in_use(uvm_plain.firecracker_pid)
 
 
 @pytest.mark.skipif(
@@ -201,17 +241,20 @@ def test_ept_violation_count(
     )
 
     # Wait for microvm to boot. Then spawn fast_page_fault_helper to setup an environment where we can trigger
-    # a lot of fast_page_faults after restoring the snapshot.
+    # a lot of fast_page_faults after restoring the snapshot. The helper is done initializing once it went to
+    # sleep in sigwait (after touching all its memory), so poll for that instead of sleeping for a fixed time.
     rc, _, _ = vm.ssh.run(
-        "nohup /usr/local/bin/fast_page_fault_helper >/dev/null 2>&1 </dev/null &"
+        "nohup /usr/local/bin/fast_page_fault_helper >/dev/null 2>&1 </dev/null & "
+        "pid=$!; "
+        "while [ -e /proc/$pid ]; do "
+        "grep -qs fast_page_fault /proc/$pid/comm && "
+        "grep -qs '^State:.*sleeping' /proc/$pid/status && exit 0; "
+        "sleep 0.05; "
+        "done; "
+        "exit 1",
+        timeout=30,
     )
-    assert not rc
-
-    rc, pid, _ = vm.ssh.run("pidof fast_page_fault_helper")
-    assert not rc
-
-    # Give the helper time to initialize
-    time.sleep(5)
+    assert not rc, "fast_page_fault_helper exited before initializing"
 
     snapshot = vm.snapshot_full()
 
@@ -233,12 +276,17 @@ def test_ept_violation_count(
         vm.wait_for_up()
 
         # Verify if guest can run commands, and also wake up the fast page fault helper to trigger page faults.
-        rc, _, _ = vm.ssh.run(f"kill -s {signal.SIGUSR1} {pid}")
+        # Then wait for the helper to exit, which it only does after touching all its pages again (it blocks
+        # SIGUSR1, so the signal wakes it up from sigwait instead of killing it). All of this happens in a single
+        # SSH session, to avoid paying for connection setup multiple times.
+        rc, _, _ = vm.ssh.run(
+            "pid=$(pidof fast_page_fault_helper) && "
+            "kill -s USR1 $pid && "
+            "while [ -e /proc/$pid ]; do sleep 0.1; done",
+            timeout=30,
+        )
         assert not rc
 
-        # Give the helper time to touch all its pages
-        time.sleep(5)
-
         if global_props.cpu_architecture == "x86_64":
             trace_entry = "reason EPT_VIOLATION"
             metric = "ept_violations"
@@ -249,11 +297,10 @@ def test_ept_violation_count(
             trace_entry = "kvm_guest_fault"
             metric = "guest_page_faults"
 
-        _, metric_value, _ = utils.run_cmd(
-            f"cat /sys/kernel/tracing/trace | grep '{trace_entry}' | wc -l"
-        )
+        with open("/sys/kernel/tracing/trace", encoding="utf-8") as trace:
+            metric_value = sum(trace_entry in line for line in trace)
 
-    metrics.put_metric(metric, int(metric_value), "Count")
+    metrics.put_metric(metric, metric_value, "Count")
 
 
 @pytest.mark.skipif(
@@ -265,8 +312,14 @@ def test_negative_huge_pages_plus_balloon(uvm_plain):
     uvm_plain.memory_monitor = None
     uvm_plain.spawn()
 
+    # Only the machine configuration matters for these checks, so skip the boot source and rootfs
+    # requests `basic_config` would do on top of it.
+    machine_config = {"vcpu_count": 2, "mem_size_mib": 256}
+
     # Ensure setting huge pages and then adding a balloon device doesn't work
-    uvm_plain.basic_config(huge_pages=HugePagesConfig.HUGETLBFS_2MB)
+    uvm_plain.api.machine_config.put(
+        **machine_config, huge_pages=HugePagesConfig.HUGETLBFS_2MB
+    )
     with pytest.raises(
         RuntimeError,
         match="Firecracker's huge pages support is incompatible with memory ballooning.",
@@ -274,13 +327,15 @@ def test_negative_huge_pages_plus_balloon(uvm_plain):
         uvm_plain.api.balloon.put(amount_mib=0, deflate_on_oom=False)
 
     # Ensure adding a balloon device and then setting huge pages doesn't work
-    uvm_plain.basic_config(huge_pages=HugePagesConfig.NONE)
+    uvm_plain.api.machine_config.put(**machine_config, huge_pages=HugePagesConfig.NONE)
     uvm_plain.api.balloon.put(amount_mib=0, deflate_on_oom=False)
     with pytest.raises(
         RuntimeError,
         match="Machine config error: Firecracker's huge pages support is incompatible with memory ballooning.",
     ):
-        uvm_plain.basic_config(huge_pages=HugePagesConfig.HUGETLBFS_2MB)
+        uvm_plain.api.machine_config.put(
+            **machine_config, huge_pages=HugePagesConfig.HUGETLBFS_2MB
+        )
 
 
 @pytest.mark.skipif(
@@ -5,6 +5,9 @@
 import os
 import time
 
+import pytest
+from tenacity import retry, stop_after_delay, wait_fixed
+
 from host_tools.cargo_build import run_seccompiler_bin
 
 
@@ -31,33 +34,39 @@ def test_startup_time_daemonize(
         _test_startup_time(microvm, metrics, "daemonize")
 
 
+@pytest.fixture(scope="session")
+def custom_seccomp_bpf(test_fc_session_root_path):
+    """Compile the custom seccomp filter once, to be shared by all iterations"""
+    bpf_path = os.path.join(test_fc_session_root_path, "bpf.out")
+    run_seccompiler_bin(bpf_path)
+    return bpf_path
+
+
 def test_startup_time_custom_seccomp(
-    microvm_factory, guest_kernel_linux_5_10, rootfs, metrics
+    microvm_factory, guest_kernel_linux_5_10, rootfs, metrics, custom_seccomp_bpf
 ):
     """
     Check the startup time when using custom seccomp filters.
     """
     for _ in range(10):
         microvm = microvm_factory.build(guest_kernel_linux_5_10, rootfs)
-        _custom_filter_setup(microvm)
+        _custom_filter_setup(microvm, custom_seccomp_bpf)
         _test_startup_time(microvm, metrics, "custom_seccomp")
 
 
 def _test_startup_time(microvm, metrics, test_suffix: str):
+    # process_startup_time_us covers the time from the jailer starting until the API server is up, which
+    # happens during spawn(), so the time window we bound it by needs to include spawning.
+    test_start_time = time.time()
     microvm.spawn()
     microvm.basic_config(vcpu_count=2, mem_size_mib=1024)
     metrics.set_dimensions(
         {**microvm.dimensions, "performance_test": f"test_startup_time_{test_suffix}"}
     )
-    test_start_time = time.time()
     microvm.start()
-    time.sleep(0.4)
 
-    # The metrics should be at index 1.
-    # Since metrics are flushed at InstanceStart, the first line will suffice.
-    datapoints = microvm.get_all_metrics()
+    fc_metrics = _get_startup_metrics(microvm)
     test_end_time = time.time()
-    fc_metrics = datapoints[0]
     startup_time_us = fc_metrics["api_server"]["process_startup_time_us"]
     cpu_startup_time_us = fc_metrics["api_server"]["process_startup_time_cpu_us"]
 
@@ -78,10 +87,17 @@ def _test_startup_time(microvm, metrics, test_suffix: str):
     metrics.put_metric("startup_time", cpu_startup_time_us, unit="Microseconds")
 
 
-def _custom_filter_setup(test_microvm):
-    bpf_path = os.path.join(test_microvm.path, "bpf.out")
+@retry(wait=wait_fixed(0.02), stop=stop_after_delay(1), reraise=True)
+def _get_startup_metrics(microvm):
+    """Wait for the metrics flushed at InstanceStart to show up, and return them
+
+    Since metrics are flushed at InstanceStart, the first line will suffice.
+    """
+    datapoints = microvm.get_all_metrics()
+    assert datapoints, "No metrics were flushed at InstanceStart"
+    return datapoints[0]
 
-    run_seccompiler_bin(bpf_path)
 
+def _custom_filter_setup(test_microvm, bpf_path):
     test_microvm.create_jailed_resource(bpf_path)
     test_microvm.jailer.extra_args.update({"seccomp-filter": "bpf.out"})
@@ -2,14 +2,16 @@
 # SPDX-License-Identifier: Apache-2.0
 """Performance benchmark for snapshot restore."""
 import tempfile
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from functools import lru_cache
 from typing import List
 
 import pytest
 
 import host_tools.drive as drive_tools
-from framework.microvm import Microvm
+from framework import defs
+from framework.microvm import Microvm, SnapshotType
 from host_tools.fcmetrics import FCMetricsMonitor
 
 USEC_IN_MSEC = 1000
@@ -18,10 +20,19 @@ ITERATIONS = 30
 
 @lru_cache
 def get_scratch_drives():
-    """Create an array of scratch disks."""
+    """Create an array of scratch disks.
+
+    The disks are placed under the test session root, which is on the same tmpfs as the jails, so they get
+    hard linked into the jails instead of copied.
+    """
     scratchdisks = ["vdb", "vdc", "vdd", "vde"]
     return [
-        (drive, drive_tools.FilesystemFile(tempfile.mktemp(), size=64))
+        (
+            drive,
+            drive_tools.FilesystemFile(
+                tempfile.mktemp(dir=defs.DEFAULT_TEST_SESSION_ROOT_PATH), size=64
+            ),
+        )
         for drive in scratchdisks
     ]
 
@@ -46,6 +57,7 @@ class SnapshotRestoreTest:
         microvm_factory,
         guest_kernel,
         rootfs,
+        track_dirty_pages=False,
     ) -> Microvm:
         """Creates the initial snapshot that will be loaded repeatedly to sample latencies"""
         vm = microvm_factory.build(
@@ -59,6 +71,7 @@ class SnapshotRestoreTest:
             vcpu_count=self.vcpus,
             mem_size_mib=self.mem,
             rootfs_io_engine="Sync",
+            track_dirty_pages=track_dirty_pages,
         )
 
         for _ in range(self.nets):
@@ -83,31 +96,49 @@ class SnapshotRestoreTest:
         """Collects latency samples for the microvm configuration specified by this instance"""
         values = []
 
-        for _ in range(ITERATIONS):
-            microvm = microvm_factory.build(
+        def build_microvm(_):
+            return microvm_factory.build(
                 kernel=guest_kernel_linux_4_14,
                 monitor_memory=False,
             )
-            microvm.spawn()
-            microvm.restore_from_snapshot(snapshot, resume=True)
-
-            fcmetrics = FCMetricsMonitor(microvm)
-            fcmetrics.start()
-            microvm.wait_for_up()
-
-            value = 0
-            # Parse all metric data points in search of load_snapshot time.
-            microvm.flush_metrics()
-            metrics = microvm.get_all_metrics()
-            for data_point in metrics:
-                cur_value = data_point["latencies_us"]["load_snapshot"]
-                if cur_value > 0:
-                    value = cur_value / USEC_IN_MSEC
-                    break
-            assert value > 0
-            values.append(value)
-            fcmetrics.stop()
-            microvm.kill()
+
+        # Setting up the jail and network namespace of a microVM is independent of everything else, so do it for
+        # all iterations upfront, in parallel.
+        with ThreadPoolExecutor() as executor:
+            microvms = list(executor.map(build_microvm, range(ITERATIONS)))
+
+        # Spawning a microVM does not depend on the previous iterations either, so spawn the microVM for the next
+        # iteration in the background while the current one is being checked and torn down.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_spawn = executor.submit(microvms[0].spawn)
+
+            for iteration, microvm in enumerate(microvms):
+                next_spawn.result()
+                microvm.restore_from_snapshot(snapshot, resume=True)
+
+                # Only start spawning after the restore, so that it does not compete with the restore being measured.
+                if iteration + 1 < len(microvms):
+                    next_spawn = executor.submit(microvms[iteration + 1].spawn)
+
+                fcmetrics = FCMetricsMonitor(microvm)
+                fcmetrics.start()
+
+                # load_snapshot is recorded before the restore request returns, so waiting for the guest to respond
+                # is not needed to sample it. Checking once that restored guests are functional is enough, and saves
+                # an SSH round trip on every other iteration.
+                if iteration == 0:
+                    microvm.wait_for_up()
+
+                # load_snapshot is a store metric, so it is present in every data point flushed after the restore,
+                # and there is no need to search all previous data points for it.
+                value = (
+                    microvm.flush_metrics()["latencies_us"]["load_snapshot"]
+                    / USEC_IN_MSEC
+                )
+                assert value > 0
+                values.append(value)
+                fcmetrics.stop()
+                microvm.kill()
 
         snapshot.delete()
         return values
@@ -130,7 +161,7 @@ class SnapshotRestoreTest:
     ids=lambda x: x.id,
 )
 def test_restore_latency(
-    microvm_factory, rootfs, guest_kernel_linux_4_14, test_setup, metrics
+    microvm_factory, rootfs, guest_kernel_linux_4_14, test_setup, metrics, request
 ):
     """
     Restores snapshots with vcpu/memory configuration, roughly scaling according to mem = (vcpus - 1) * 2048MB,
@@ -139,7 +170,13 @@ def test_restore_latency(
 
     We only test a single guest kernel, as the guest kernel does not "participate" in snapshot restore.
     """
-    vm = test_setup.configure_vm(microvm_factory, guest_kernel_linux_4_14, rootfs)
+    use_diff_template = request.config.getoption("--use-diff-template")
+    vm = test_setup.configure_vm(
+        microvm_factory,
+        guest_kernel_linux_4_14,
+        rootfs,
+        track_dirty_pages=use_diff_template,
+    )
     vm.start()
     vm.wait_for_up()
 
@@ -156,7 +193,14 @@ def test_restore_latency(
     fcmetrics = FCMetricsMonitor(vm)
     fcmetrics.start()
 
-    snapshot = vm.snapshot_full()
+    if use_diff_template:
+        # The first diff snapshot contains every page dirtied since boot, in a sparse memory file that
+        # is much cheaper to write than a full one for large, mostly untouched guests. The file still covers
+        # all of guest memory, so restore it as a full snapshot, to not enable dirty page tracking on the
+        # microVMs whose restore latency we measure.
+        snapshot = replace(vm.snapshot_diff(), snapshot_type=SnapshotType.FULL)
+    else:
+        snapshot = vm.snapshot_full()
     fcmetrics.stop()
     vm.kill()
 
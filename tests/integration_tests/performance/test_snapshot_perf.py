@@ -1,9 +1,15 @@
 # Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 """Basic tests scenarios for snapshot save/restore."""
+import statistics
 
-# How many latencies do we sample per test.
+# How many snapshots to take and discard before sampling, to warm up the caches.
+WARMUP_COUNT = 1
+# How many latencies we always sample per test. If the samples are noisy, e.g. their relative standard
+# deviation is at least STABLE_RSD, sampling continues up to MAX_SAMPLE_COUNT.
 SAMPLE_COUNT = 3
+MAX_SAMPLE_COUNT = 10
+STABLE_RSD = 0.05
 USEC_IN_MSEC = 1000
 
 
@@ -36,5 +42,15 @@ def test_snapshot_create_latency(
     metrics.set_dimensions(
         {**vm.dimensions, "performance_test": "test_snapshot_create_latency"}
     )
-    for _ in range(SAMPLE_COUNT):
-        metrics.put_metric("latency", snapshot_create_producer(vm), "Milliseconds")
+    for _ in range(WARMUP_COUNT):
+        snapshot_create_producer(vm)
+
+    samples = []
+    while len(samples) < MAX_SAMPLE_COUNT:
+        samples.append(snapshot_create_producer(vm))
+        metrics.put_metric("latency", samples[-1], "Milliseconds")
+
+        if len(samples) < SAMPLE_COUNT:
+            continue
+        if statistics.stdev(samples) < STABLE_RSD * statistics.mean(samples):
+            break
@@ -82,8 +82,9 @@ def process_log_entry(emf: dict):
 
     Returns the entries dimensions and its list-valued properties/metrics, together with their units
     """
+    units = find_units(emf)
     result = {
-        key: (value, find_unit(emf, key))
+        key: (value, units.get(key, "None"))
         for key, value in emf.items()
         if (
             "fc_metrics" not in key
@@ -99,12 +100,11 @@ def process_log_entry(emf: dict):
     return extract_dimensions(emf), result
 
 
-def find_unit(emf: dict, metric: str):
-    """Determines the unit of the given metric"""
-    metrics = {
+def find_units(emf: dict):
+    """Determines the units of all metrics in the given EMF log entry"""
+    return {
         y["Name"]: y["Unit"] for y in emf["_aws"]["CloudWatchMetrics"][0]["Metrics"]
     }
-    return metrics.get(metric, "None")
 
 
 def load_data_series(report_path: Path, revision: str = None, *, reemit: bool = False):
@@ -189,8 +189,8 @@ def analyze_data(
 
     Returns a mapping of dimensions and properties/metrics to the result of their regression test.
     """
-    assert set(processed_emf_a.keys()) == set(
-        processed_emf_b.keys()
+    assert (
+        processed_emf_a.keys() == processed_emf_b.keys()
     ), "A and B run produced incomparable data. This is a bug in the test!"
 
     results = {}
@@ -204,8 +204,8 @@ def analyze_data(
         metrics_a = processed_emf_a[dimension_set]
         metrics_b = processed_emf_b[dimension_set]
 
-        assert set(metrics_a.keys()) == set(
-            metrics_b.keys()
+        assert (
+            metrics_a.keys() == metrics_b.keys()
         ), "A and B run produced incomparable data. This is a bug in the test!"
 
         for metric, (values_a, unit) in metrics_a.items():
@@ -223,7 +223,8 @@ def analyze_data(
             metrics_logger.set_property("data_b", metrics_b[metric][0])
             metrics_logger.flush()
 
-            results[dimension_set, metric] = (result, unit)
+            # statistics.fmean works on floats directly, avoiding statistics.mean's exact (but slow) rational arithmetic
+            results[dimension_set, metric] = (result, unit, statistics.fmean(values_a))
 
     # We sort our A/B-Testing results keyed by metric here. The resulting lists of values
     # will be approximately normal distributed, and we will use this property as a means of error correction.
@@ -263,36 +264,43 @@ def analyze_data(
     relative_changes_significant = defaultdict(list)
 
     failures = []
-    for (dimension_set, metric), (result, unit) in results.items():
+    for (dimension_set, metric), (result, unit, baseline_mean) in results.items():
         if is_ignored(dict(dimension_set)):
             continue
 
-        values_a = processed_emf_a[dimension_set][metric][0]
-        baseline_mean = statistics.mean(values_a)
-
         relative_changes_by_metric[metric].append(result.statistic / baseline_mean)
 
         if result.pvalue < p_thresh and abs(result.statistic) > strength_abs_thresh:
-            failures.append((dimension_set, metric, result, unit))
+            failures.append((dimension_set, metric, result, unit, baseline_mean))
 
             relative_changes_significant[metric].append(
                 result.statistic / baseline_mean
             )
 
+    # The averages only depend on the metric, not on the individual failure, so compute them once per metric
+    mean_relative_changes_by_metric = {
+        metric: statistics.fmean(changes)
+        for metric, changes in relative_changes_by_metric.items()
+    }
+    mean_significant_changes = {
+        metric: statistics.fmean(changes)
+        for metric, changes in relative_changes_significant.items()
+    }
+
     messages = []
-    for dimension_set, metric, result, unit in failures:
+    for dimension_set, metric, result, unit, old_mean in failures:
         # Sanity check as described above
-        if abs(statistics.mean(relative_changes_by_metric[metric])) <= noise_threshold:
+        if abs(mean_relative_changes_by_metric[metric]) <= noise_threshold:
             continue
 
         # No data points for this metric were deemed significant
-        if metric not in relative_changes_significant:
+        if metric not in mean_significant_changes:
             continue
 
         # The significant data points themselves are above the noise threshold
-        if abs(statistics.mean(relative_changes_significant[metric])) > noise_threshold:
-            old_mean = statistics.mean(processed_emf_a[dimension_set][metric][0])
-            new_mean = statistics.mean(processed_emf_b[dimension_set][metric][0])
+        if abs(mean_significant_changes[metric]) > noise_threshold:
+            # The test statistic is the difference of the means of the B and A samples
+            new_mean = old_mean + result.statistic
 
             msg = (
                 f"\033[0;32m[Firecracker A/B-Test Runner]\033[0m A/B-testing shows a change of "
@@ -10,6 +10,7 @@ Test all the ext4 rootfs in the current directory
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Hack to be able to import testing framework functions.
@@ -29,12 +30,21 @@ kernel = kernels[-1]
 vmfcty = MicroVMFactory(*get_firecracker_binaries())
 # (may take a while to compile Firecracker...)
 
-for rootfs in Path(".").glob("*.ext4"):
-    print(f">>>> Testing {rootfs}")
+
+def test_rootfs(rootfs):
+    """Boot a microVM from the given rootfs, and check it is reachable via SSH"""
     uvm = vmfcty.build(kernel, rootfs)
     uvm.spawn()
     uvm.add_net_iface()
     uvm.basic_config()
     uvm.start()
-    rc, stdout, stderr = uvm.ssh.run("cat /etc/issue")
-    print(rc, stdout, stderr)
+    return rootfs, uvm.ssh.run("cat /etc/issue")
+
+
+# Each rootfs is tested in its own microVM, so they can all be booted in parallel.
+with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+    for rootfs, (rc, stdout, stderr) in executor.map(
+        test_rootfs, Path(".").glob("*.ext4")
+    ):
+        print(f">>>> {rootfs}: rc={rc}")
+        print(stdout, stderr)